@@ -66,3 +66,44 @@ def calculate_ref_table_and_differences(peaks, heights, fwhm, ref_df=None):
             for j in range(1, df.shape[1]):
                 df.iloc[i, j] = str(df.iloc[i, j]) + "/" + str(diff.iloc[i, j - 1])
     return df, diff
+
+
+def calculate_reference_thresholds(ref_df, threshold_position):
+    """Derive the default deviation thresholds from a reference table
+
+    Args:
+        ref_df (pandas.DataFrame): table of Peaks, Heights, FWHM of reference sample
+        threshold_position (float): threshold for peak positions (in seconds)
+
+    Returns:
+        dict of thresholds for "position", "fwhm" and "height"; fwhm and height are
+        10% of the largest value in the respective row of the reference table
+    """
+    _, threshold_height, threshold_fwhm = np.round(
+        ref_df.filter(regex="Peak*").max(axis=1).values / 10.0, 2
+    )
+    return {
+        "position": threshold_position,
+        "fwhm": float(threshold_fwhm),
+        "height": float(threshold_height),
+    }
+
+
+def apply_threshold_overrides(thresholds, position=None, fwhm=None, height=None):
+    """Replace a reference's thresholds with any values supplied by the user
+
+    Args:
+        thresholds (dict): thresholds of a reference (see
+            calculate_reference_thresholds)
+        position (float): user supplied threshold for peak positions, if any
+        fwhm (float): user supplied threshold for full-width-at-half-maximum, if any
+        height (float): user supplied threshold for the height of the peak, if any
+
+    Returns:
+        dict of thresholds for "position", "fwhm" and "height"
+    """
+    overrides = {"position": position, "fwhm": fwhm, "height": height}
+    return {
+        k: thresholds[k] if overrides[k] is None else overrides[k]
+        for k in ["position", "fwhm", "height"]
+    }
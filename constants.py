@@ -14,3 +14,12 @@ TABLE_HEADER = {
     "backgroundColor": "rgb(230, 230, 230)",
     "fontWeight": "bold",
 }
+
+# rows of the differences table returned by calculate_ref_table_and_differences
+DIFFERENCE_ROWS = {"positions": 0, "heights": 1, "fwhms": 2}
+
+# sample information fields used to match a sample to its reference file
+REFERENCE_KEY_FIELDS = ["Method Name", "Method Version"]
+MISSING_KEY_FIELDS_MESSAGE = "skipped, file must contain {}".format(
+    " and ".join(REFERENCE_KEY_FIELDS)
+)
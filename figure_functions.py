@@ -62,7 +62,7 @@ def make_fig_for_diff_tables(df, tolerance):
             go.Scatter(
                 x=df.columns,
                 y=df.iloc[i, :].values,
-                name="Sample " + str(i + 1),
+                name=str(df.index[i]),
                 mode="lines+markers",
             )
         )
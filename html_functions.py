@@ -4,10 +4,20 @@ import json
 
 import dash_bootstrap_components as dbc
 import numpy as np
+import pandas as pd
 from dash import dash_table, dcc, html
 
-from analytical_functions import calculate_ref_table_and_differences, find_peaks_scipy
-from constants import ALTERNATE_ROW_HIGHLIGHTING, TABLE_HEADER
+from analytical_functions import (
+    calculate_ref_table_and_differences,
+    calculate_reference_thresholds,
+    find_peaks_scipy,
+)
+from constants import (
+    ALTERNATE_ROW_HIGHLIGHTING,
+    REFERENCE_KEY_FIELDS,
+    TABLE_HEADER,
+    THRESHOLD_POSITION,
+)
 from figure_functions import make_fig_for_diff_tables, make_spectrum_with_picked_peaks
 
 
@@ -26,18 +36,17 @@ def parse_contents(contents):
     return j
 
 
-def get_file_contents_and_analyze(content, filename, ref_df=None):
-    """Generate dash components from peak, sample info
+def analyze_sample(j, filename, ref_df=None):
+    """Generate dash components from an already parsed sample
 
     Args:
-        content (str): contents of an uploaded file
+        j (dict): parsed contents of an uploaded file (see parse_contents)
         filename (str): name of an uploaded file
         ref_df (pd.DataFrame): reference sample data
 
     Returns: tuple of sample information as html, plotly figure, dataframe of sample,
         dataframe of difference between reference and sample
     """
-    j = parse_contents(content)
     x = np.array(j["time"][:6000])
     y = np.array(j["intensities"]["254"][:6000])
     peaks, heights, fwhm, hm, leftips, rightips = find_peaks_scipy(y, height=0.1)
@@ -56,6 +65,91 @@ def get_file_contents_and_analyze(content, filename, ref_df=None):
     return info_card, fig, data_table, differences
 
 
+def make_reference_key(sample_info):
+    """Make the key used to match a sample to its reference in the reference library
+
+    Args:
+        sample_info (dict): information about sample such as method name or
+            run date, etc.
+
+    Returns:
+        str of the REFERENCE_KEY_FIELDS values joined by " v" (e.g. "Method v12"), or
+        None if any of those fields is missing from sample_info
+    """
+    if any(i not in sample_info for i in REFERENCE_KEY_FIELDS):
+        return None
+    return " v".join(str(sample_info[i]) for i in REFERENCE_KEY_FIELDS)
+
+
+def make_thresholds_text(thresholds):
+    """Describe the thresholds used to highlight deviations from a reference
+
+    Args:
+        thresholds (dict): thresholds for "position", "fwhm" and "height" (see
+            calculate_reference_thresholds)
+
+    Returns:
+        str such as "Thresholds: position 3 s, FWHM 1.2 s, height 0.05"
+    """
+    return "Thresholds: position {} s, FWHM {} s, height {}".format(
+        thresholds["position"], thresholds["fwhm"], thresholds["height"]
+    )
+
+
+def make_warning_alert(filename, message):
+    """Makes a dash-bootstrap style alert for a file that could not be processed
+
+    Args:
+        filename (str): name of the file being processed
+        message (str): reason the file was skipped
+
+    Returns:
+        dbc.Alert
+    """
+    return dbc.Alert(
+        "{}: {}".format(filename, message), color="warning", className="mt-3"
+    )
+
+
+def add_to_reference_library(library, key, filename, data_table):
+    """Add a reference sample and its precomputed thresholds to the reference library
+
+    Args:
+        library (dict): reference library keyed by make_reference_key; modified
+            in place
+        key (str): key of the reference sample (see make_reference_key)
+        filename (str): name of the reference file
+        data_table (pd.DataFrame): table of Peaks, Heights, FWHM of reference sample
+    """
+    library[key] = {
+        "filename": filename,
+        "reference": data_table.to_json(orient="split"),
+        "thresholds": calculate_reference_thresholds(data_table, THRESHOLD_POSITION),
+    }
+
+
+def load_reference_library(data):
+    """Decode the reference library from dcc.Store and read its peak tables once
+
+    Args:
+        data (str): json-string of the reference library as stored in dcc.Store
+
+    Returns:
+        dict mapping each reference key to a dict of its reference table
+        (pd.DataFrame) and its thresholds
+    """
+    if not data:
+        return {}
+    library = json.loads(data)
+    return {
+        key: {
+            "reference": pd.read_json(entry["reference"], orient="split"),
+            "thresholds": entry["thresholds"],
+        }
+        for key, entry in library.items()
+    }
+
+
 def put_tab_2_into_html(
     positions, threshold_position, fwhms, threshold_fwhm, heights, threshold_height
 ):
@@ -63,7 +157,7 @@ def put_tab_2_into_html(
 
     Args:
         positions (pd.DataFrame): table of differences in peak positions for all samples
-            compared to reference
+            compared to reference, indexed by sample filename
         threshold_position (float): max absolute deviation allowed for position
         fwhms (pd.DataFrame): table of differences in peak Full-width-at half-maximums
             for all samples compared to reference
@@ -92,7 +186,10 @@ def put_tab_2_into_html(
         table
         for table in map(
             make_dash_table_from_dataframe,
-            [positions, fwhms, heights],  # table value
+            [
+                df.rename_axis("Sample").reset_index()
+                for df in [positions, fwhms, heights]
+            ],  # table value
             [2, 2, 2],  # with_slash value
             [threshold_position, threshold_fwhm, threshold_height],  # threshold value
         )
@@ -123,7 +220,7 @@ def make_sample_info_card(sample_info, filename):
             children=[html.P(filename)]
             + [
                 html.P([html.B(i), ": ", sample_info[i]])
-                for i in ["Sample Name", "Method Name", "Run Date"]
+                for i in ["Sample Name", "Method Name", "Method Version", "Run Date"]
             ],
         )
     )
@@ -270,9 +367,9 @@ def highlight_cells_without_slash(table, threshold):
             "color": "tomato",
             "fontWeight": "bold",
         }
-        if abs(float(table.iloc[r, c])) >= threshold
+        if abs(float(table[col].iloc[r])) >= threshold
         else {}
-        for c, col in enumerate(table.columns)
-        for r, row in enumerate(table.index)
+        for col in table.filter(regex="Peak*").columns
+        for r in range(table.shape[0])
     ]
     return highlight
@@ -2,15 +2,21 @@ import json
 
 import dash
 import dash_bootstrap_components as dbc
-import numpy as np
 import pandas as pd
 from dash import dcc, html
-from dash.dependencies import Input, Output, State
+from dash.dependencies import ALL, Input, Output, State
 
-from constants import THRESHOLD_POSITION
+from analytical_functions import apply_threshold_overrides
+from constants import DIFFERENCE_ROWS, MISSING_KEY_FIELDS_MESSAGE
 from html_functions import (
-    get_file_contents_and_analyze,
+    add_to_reference_library,
+    analyze_sample,
+    load_reference_library,
     make_dash_table_from_dataframe,
+    make_reference_key,
+    make_thresholds_text,
+    make_warning_alert,
+    parse_contents,
     put_tab_2_into_html,
 )
 
@@ -20,19 +26,33 @@ app = dash.Dash(
     prevent_initial_callbacks=True,
 )
 
-# contains the reference file
+# contains the reference files, one per Method Name / Method Version
 tab1 = dbc.Tab(
-    label="Reference File",
+    label="Reference Files",
     id="tab-1",
     children=[
         dbc.Row(
-            dbc.Col(
-                dcc.Upload(
-                    id="upload-data",
-                    children=dbc.Button("Upload a reference file", color="primary"),
+            children=[
+                dbc.Col(
+                    dcc.Upload(
+                        id="upload-data",
+                        multiple=True,
+                        children=dbc.Button(
+                            "Add reference files (one per method)", color="primary"
+                        ),
+                    ),
+                    width=12,
                 ),
-                width=12,
-            ),
+                dbc.Col(
+                    dbc.Button(
+                        "Clear reference files",
+                        id="clear-references",
+                        color="secondary",
+                        outline=True,
+                    ),
+                    width=12,
+                ),
+            ],
             align="center",
             className="mt-3 mb-3 d-grid gap-2",
         ),
@@ -41,7 +61,7 @@ tab1 = dbc.Tab(
     ],
 )
 
-# shows overall summary graphs of deviations from reference file
+# shows overall summary graphs of deviations from the matching reference files
 tab2 = dbc.Tab(
     label="Sample Files",
     id="tab-2",
@@ -52,7 +72,7 @@ tab2 = dbc.Tab(
                     id="upload-data-multiple",
                     multiple=True,
                     children=dbc.Button(
-                        "Upload files to compare with reference file",
+                        "Upload files to compare with their reference files",
                         color="primary",
                         # block=True,
                     ),
@@ -68,7 +88,8 @@ tab2 = dbc.Tab(
                         dbc.Input(
                             id="{}-threshold".format(k),
                             type="number",
-                            placeholder="{} threshold".format(k[0].upper() + k[1::]),
+                            # left empty, each reference's own threshold is used
+                            placeholder="Per reference (override)",
                             step=0.01,
                         ),
                     ],
@@ -92,6 +113,7 @@ tab3 = dbc.Tab(
     id="tab-3",
     children=[
         html.Div(id="samples-uploaded"),
+        dcc.Store(id="samples-table-storage"),
     ],
 )
 app.layout = dbc.Container(dbc.Tabs(children=[tab1, tab2, tab3], className="nav-fill"))
@@ -100,72 +122,152 @@ app.layout = dbc.Container(dbc.Tabs(children=[tab1, tab2, tab3], className="nav-
 @app.callback(
     Output("reference-row", "children"),
     Output("reference-table", "data"),
+    Output("upload-data", "contents"),
     Input("upload-data", "contents"),
+    Input("clear-references", "n_clicks"),
     State("upload-data", "filename"),
+    State("reference-row", "children"),
+    State("reference-table", "data"),
 )
-def update_output_tab_1(contents, filename):
+def update_output_tab_1(contents, n_clicks, filename, existing_children, data):
+    triggered = dash.callback_context.triggered[0]["prop_id"].split(".")[0]
+    # contents are reset after each upload, otherwise dcc.Upload does not fire when
+    # the same file is picked again (e.g. after clearing the references)
+    if triggered == "clear-references":
+        return [], json.dumps({}), None
+
     if contents is not None:
-        info_card, fig, data_table, diff = get_file_contents_and_analyze(
-            contents, filename
-        )
-        data = {"reference": data_table.to_json(orient="split")}
-        col1 = dbc.Col(info_card, width=3)
-        col2 = dbc.Col(dcc.Graph(figure=fig), width=9)
-        row1 = dbc.Row(children=[col1, col2], align="center")
-        row2 = make_dash_table_from_dataframe(table=data_table, with_slash=1)
-        return [row1, row2], json.dumps(data)
+        # new references are added to the ones already uploaded
+        children = existing_children or []
+        library = json.loads(data) if data else {}
+        for content, f in zip(contents, filename):
+            sample_info = parse_contents(content)
+            key = make_reference_key(sample_info)
+            if key is None:
+                children.append(make_warning_alert(f, MISSING_KEY_FIELDS_MESSAGE))
+                continue
+            if key in library:
+                children.append(
+                    make_warning_alert(
+                        f,
+                        "skipped, {} already uses {} as its reference".format(
+                            key, library[key]["filename"]
+                        ),
+                    )
+                )
+                continue
+
+            info_card, fig, data_table, diff = analyze_sample(sample_info, f)
+            add_to_reference_library(library, key, f, data_table)
+            title = html.H4(
+                [
+                    key,
+                    html.Br(),
+                    html.Small(
+                        make_thresholds_text(library[key]["thresholds"]),
+                        className="text-muted",
+                    ),
+                ],
+                className="mt-3 mb-3",
+            )
+            col1 = dbc.Col(info_card, width=3)
+            col2 = dbc.Col(dcc.Graph(figure=fig), width=9)
+            row1 = dbc.Row(children=[col1, col2], align="center")
+            row2 = make_dash_table_from_dataframe(table=data_table, with_slash=1)
+            children += [title, row1, row2]
+        return children, json.dumps(library), None
+
+    else:
+        return dash.no_update, dash.no_update, dash.no_update
 
 
 @app.callback(
     Output("samples-uploaded", "children"),
+    Output("samples-table-storage", "data"),
     Output("differences-table-storage", "data"),
     Input("upload-data-multiple", "contents"),
     Input("reference-table", "data"),
-    [Input("{}-threshold".format(i), "value") for i in ["position", "fwhm", "height"]],
     State("upload-data-multiple", "filename"),
 )
-def update_output_tab_3(
-    contents, data, threshold_position, threshold_fwhm, threshold_height, filename
-):
+def update_output_tab_3(contents, data, filename):
     if contents is not None:
         children = []
-        positions = pd.DataFrame()
-        fwhms = pd.DataFrame()
-        heights = pd.DataFrame()
+        # the tables are rendered by highlight_sample_tables so that changing a
+        # threshold does not pick the peaks of every sample again
+        tables = []
+        # differences are summarised separately for each reference
+        summaries = {}
 
-        ref_df = json.loads(data)
-        ref_df = pd.read_json(ref_df["reference"], orient="split")
+        references = load_reference_library(data)
         for content, f in zip(contents, filename):
-            info_card, fig, data_table, diff = get_file_contents_and_analyze(
-                content, f, ref_df
+            sample_info = parse_contents(content)
+            key = make_reference_key(sample_info)
+            if key is None:
+                children.append(make_warning_alert(f, MISSING_KEY_FIELDS_MESSAGE))
+                continue
+            if key not in references:
+                children.append(
+                    make_warning_alert(f, "no reference file uploaded for " + key)
+                )
+                continue
+
+            info_card, fig, data_table, diff = analyze_sample(
+                sample_info, f, references[key]["reference"]
             )
             col1 = dbc.Col(info_card, width=3)
             col2 = dbc.Col(dcc.Graph(figure=fig), width=9)
             row1 = dbc.Row(children=[col1, col2], align="center")
-            row2 = make_dash_table_from_dataframe(
-                table=data_table,
-                with_slash=3,
-                threshold_position=threshold_position,
-                threshold_fwhm=threshold_fwhm,
-                threshold_height=threshold_height,
-            )
+            row2 = html.Div(id={"type": "sample-table", "index": len(tables)})
 
             children += [row1, row2]
+            tables.append(
+                {
+                    "table": data_table.to_json(orient="split"),
+                    "thresholds": references[key]["thresholds"],
+                }
+            )
+
+            summary = summaries.setdefault(key, {k: [] for k in DIFFERENCE_ROWS})
+            for k, i in DIFFERENCE_ROWS.items():
+                summary[k].append(diff.iloc[[i]].set_axis([f], axis=0))
 
-            positions = positions.append(diff.iloc[[0]])
-            fwhms = fwhms.append(diff.iloc[[1]])
-            heights = heights.append(diff.iloc[[2]])
+        if not summaries:
+            return children, json.dumps(tables), {}
 
-        peak_metadata = {
-            "positions": positions.to_json(orient="split"),
-            "fwhms": fwhms.to_json(orient="split"),
-            "heights": heights.to_json(orient="split"),
-        }
+        peak_metadata = {}
+        for key, summary in summaries.items():
+            peak_metadata[key] = {
+                k: pd.concat(v).to_json(orient="split") for k, v in summary.items()
+            }
+            peak_metadata[key]["thresholds"] = references[key]["thresholds"]
 
-        return children, json.dumps(peak_metadata)
+        return children, json.dumps(tables), json.dumps(peak_metadata)
 
     else:
-        return [], {}
+        return [], json.dumps([]), {}
+
+
+@app.callback(
+    Output({"type": "sample-table", "index": ALL}, "children"),
+    Input("samples-table-storage", "data"),
+    [Input("{}-threshold".format(i), "value") for i in ["position", "fwhm", "height"]],
+)
+def highlight_sample_tables(data, threshold_position, threshold_fwhm, threshold_height):
+    children = []
+    for sample in json.loads(data):
+        thresholds = apply_threshold_overrides(
+            sample["thresholds"], threshold_position, threshold_fwhm, threshold_height
+        )
+        children.append(
+            make_dash_table_from_dataframe(
+                table=pd.read_json(sample["table"], orient="split"),
+                with_slash=3,
+                threshold_position=thresholds["position"],
+                threshold_fwhm=thresholds["fwhm"],
+                threshold_height=thresholds["height"],
+            )
+        )
+    return children
 
 
 @app.callback(
@@ -179,40 +281,37 @@ def get_peak_metadata_from_storage(
     if metadata == {}:
         return []
     else:
-        metadata = json.loads(metadata)
-        positions = pd.read_json(
-            metadata["positions"],
-            orient="split",
-        )
-        fwhms = pd.read_json(metadata["fwhms"], orient="split")
-        heights = pd.read_json(metadata["heights"], orient="split")
-
-        positions = positions.round(2)
-        fwhms = fwhms.round(2)
-        heights = heights.round(2)
-
-        return put_tab_2_into_html(
-            positions,
-            threshold_position,
-            fwhms,
-            threshold_fwhm,
-            heights,
-            threshold_height,
-        )
-
-
-@app.callback(
-    [Output("{}-threshold".format(i), "value") for i in ["position", "fwhm", "height"]],
-    [Input("reference-table", "data")],
-)
-def calculate_thresholds(data):
-    ref_df = json.loads(data)
-    ref_df = pd.read_json(ref_df["reference"], orient="split").drop("Parameter", axis=1)
-    _, threshold_fwhm, threshold_height = np.round(
-        (ref_df.max(axis=1).values / 10.0), 2
-    )
-    threshold_position = THRESHOLD_POSITION
-    return threshold_position, threshold_height, threshold_fwhm
+        children = []
+        for key, summary in json.loads(metadata).items():
+            thresholds = apply_threshold_overrides(
+                summary["thresholds"],
+                threshold_position,
+                threshold_fwhm,
+                threshold_height,
+            )
+            positions, fwhms, heights = [
+                pd.read_json(summary[k], orient="split").round(2)
+                for k in ["positions", "fwhms", "heights"]
+            ]
+            title = html.H3(
+                [
+                    key,
+                    html.Br(),
+                    html.Small(
+                        make_thresholds_text(thresholds), className="text-muted"
+                    ),
+                ],
+                className="mt-3",
+            )
+            children += [title] + put_tab_2_into_html(
+                positions,
+                thresholds["position"],
+                fwhms,
+                thresholds["fwhm"],
+                heights,
+                thresholds["height"],
+            )
+        return children
 
 
 if __name__ == "__main__":